@@ -0,0 +1,202 @@
+# coalescencia.py
+"""Coalescencia single-flight de callbacks concurrentes con entradas idénticas.
+
+Cuando varias peticiones llegan con los mismos argumentos mientras una ya se
+está calculando, esperan a esa única ejecución y comparten su resultado.
+
+- Entre hilos de un mismo worker: siempre activo, con un evento por clave.
+- Entre workers (p. ej. gunicorn con varios procesos): opcional, indicando un
+  directorio compartido. El líder toma un `flock` por clave; un worker que
+  encuentra el lock ocupado deja una marca de espera y se bloquea. Solo si hay
+  marca el líder publica el resultado serializado, que los que esperaban
+  reutilizan si se terminó después de su llegada. Resultados y locks se borran
+  pasados `ttl` segundos.
+
+  El directorio debe ser privado del servicio (mismo usuario, permisos 0700):
+  los resultados se leen con `pickle`, así que quien pueda escribir en él
+  puede ejecutar código en los workers. Se rechaza un directorio accesible
+  por otros usuarios.
+
+Las métricas (`ejecutadas`, `colapsadas_hilos`, `colapsadas_workers`) son por
+proceso.
+"""
+import functools
+import hashlib
+import json
+import os
+import pickle
+import threading
+import time
+from collections import Counter
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+class _Llamada:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.valor = None
+        self.error = None
+
+    def resultado(self):
+        if self.error is not None:
+            raise self.error
+        return self.valor
+
+
+class SingleFlight:
+    """Agrupa ejecuciones concurrentes de la misma clave en una sola"""
+
+    def __init__(self, directorio=None, ttl=30.0):
+        self.directorio = directorio if fcntl is not None else None
+        self.ttl = ttl
+        if self.directorio:
+            os.makedirs(self.directorio, mode=0o700, exist_ok=True)
+            estado = os.stat(self.directorio)
+            if estado.st_uid != os.getuid() or estado.st_mode & 0o077:
+                raise PermissionError(
+                    f'{self.directorio} debe pertenecer al usuario del servicio y tener permisos 0700')
+        self._lock = threading.Lock()
+        self._en_vuelo = {}
+        self._metricas = Counter()
+        self._ultima_limpieza = 0.0
+
+    def ejecutar(self, clave, funcion, *args, **kwargs):
+        """Ejecuta `funcion` salvo que ya haya una ejecución en curso para `clave`"""
+        with self._lock:
+            llamada = self._en_vuelo.get(clave)
+            lider = llamada is None
+            if lider:
+                llamada = self._en_vuelo[clave] = _Llamada()
+            else:
+                self._metricas['colapsadas_hilos'] += 1
+
+        if not lider:
+            llamada.evento.wait()
+            return llamada.resultado()
+
+        try:
+            llamada.valor = self._ejecutar_lider(clave, funcion, args, kwargs)
+        except Exception as e:
+            llamada.error = e
+        finally:
+            with self._lock:
+                del self._en_vuelo[clave]
+            llamada.evento.set()
+        return llamada.resultado()
+
+    def _ejecutar_lider(self, clave, funcion, args, kwargs):
+        if not self.directorio:
+            self._contar('ejecutadas')
+            return funcion(*args, **kwargs)
+
+        self._limpiar_caducados()
+        base = os.path.join(self.directorio, hashlib.sha1(clave.encode('utf-8')).hexdigest())
+        llegada = time.time()
+        with open(base + '.lock', 'a') as cerrojo:
+            try:
+                fcntl.flock(cerrojo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                esperado = False
+            except BlockingIOError:
+                # Hay un líder en otro worker: avisar de que esperamos su resultado
+                open(base + '.esperando', 'a').close()
+                fcntl.flock(cerrojo, fcntl.LOCK_EX)
+                esperado = True
+            try:
+                if esperado:
+                    publicado = self._leer_resultado(base + '.pkl', llegada)
+                    if publicado is not None:
+                        self._contar('colapsadas_workers')
+                        if publicado['error'] is not None:
+                            raise publicado['error']
+                        return publicado['valor']
+
+                self._contar('ejecutadas')
+                try:
+                    valor = funcion(*args, **kwargs)
+                except Exception as e:
+                    self._publicar_si_esperan(base, None, e)
+                    raise
+                self._publicar_si_esperan(base, valor, None)
+                return valor
+            finally:
+                fcntl.flock(cerrojo, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _leer_resultado(ruta, llegada):
+        try:
+            with open(ruta, 'rb') as f:
+                publicado = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+        return publicado if publicado['terminado'] >= llegada else None
+
+    def _publicar_si_esperan(self, base, valor, error):
+        """Serializa el resultado solo si algún worker dejó marca de espera"""
+        try:
+            os.remove(base + '.esperando')
+        except FileNotFoundError:
+            return
+        self._publicar(base + '.pkl', valor, error)
+
+    def _limpiar_caducados(self):
+        """Borra resultados y locks más antiguos que `ttl`, como mucho una vez por `ttl`"""
+        ahora = time.time()
+        with self._lock:
+            if ahora - self._ultima_limpieza < self.ttl:
+                return
+            self._ultima_limpieza = ahora
+        for nombre in os.listdir(self.directorio):
+            ruta = os.path.join(self.directorio, nombre)
+            try:
+                if ahora - os.path.getmtime(ruta) < self.ttl:
+                    continue
+                if nombre.endswith('.lock'):
+                    # Solo se borra un lock que nadie tiene tomado
+                    with open(ruta, 'a') as cerrojo:
+                        fcntl.flock(cerrojo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        os.remove(ruta)
+                else:
+                    os.remove(ruta)
+            except (OSError, BlockingIOError):
+                continue
+
+    @staticmethod
+    def _publicar(ruta, valor, error):
+        temporal = f'{ruta}.{os.getpid()}.tmp'
+        try:
+            with open(temporal, 'wb') as f:
+                pickle.dump({'terminado': time.time(), 'valor': valor, 'error': error}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal, ruta)
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            # Resultado no serializable: los demás workers lo calcularán por su cuenta
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    def _contar(self, nombre):
+        with self._lock:
+            self._metricas[nombre] += 1
+
+    def metricas(self):
+        """Contadores del proceso y proporción de peticiones colapsadas"""
+        with self._lock:
+            m = dict(self._metricas)
+        for nombre in ('ejecutadas', 'colapsadas_hilos', 'colapsadas_workers'):
+            m.setdefault(nombre, 0)
+        colapsadas = m['colapsadas_hilos'] + m['colapsadas_workers']
+        total = colapsadas + m['ejecutadas']
+        m['ratio_colapsadas'] = colapsadas / total if total else 0.0
+        m['pid'] = os.getpid()
+        return m
+
+    def coalescer(self, funcion):
+        """Decorador: la clave son el nombre de la función y sus argumentos"""
+        @functools.wraps(funcion)
+        def envoltorio(*args, **kwargs):
+            clave = json.dumps([funcion.__qualname__, args, kwargs], sort_keys=True, default=str)
+            return self.ejecutar(clave, funcion, *args, **kwargs)
+        return envoltorio
@@ -0,0 +1,246 @@
+# consultas.py
+"""Capa de consultas con pushdown de filtros y agregaciones a DuckDB.
+
+Las tablas se materializan como ficheros Parquet y se consultan con un motor
+SQL columnar embebido, que escanea en paralelo y sin cargar el dataset
+completo en memoria. Los gráficos reciben solo el resultado agregado. Si
+`duckdb` no está instalado se usa pandas sobre los DataFrames en memoria con
+la misma interfaz.
+
+Las tablas registradas desde memoria se escriben en un directorio privado de
+cada proceso (`<base>/huawei_bi_parquet_<pid>_*`), que se borra al salir, de
+modo que cada worker de gunicorn consulta exactamente sus propios datos. Como
+`atexit` no corre tras SIGKILL o un fallo, al arrancar se borran los
+directorios de procesos que ya no existen. No usar `--preload`: los workers
+heredarían el mismo directorio y conexión.
+Las tablas registradas sin DataFrame se leen del directorio base
+(DASHBOARD_DATOS_DIR) y nunca se escriben.
+"""
+import atexit
+import glob
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover - dependencia opcional
+    duckdb = None
+
+# Número de ficheros parte a partir del cual se compacta la tabla en uno solo
+MAX_PARTES = 32
+PREFIJO_DIRECTORIO = 'huawei_bi_parquet_'
+
+# Directorios creados por este proceso, que el barrido nunca debe tocar
+_directorios_propios = set()
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def limpiar_directorios_huerfanos(base=None):
+    """Borra los directorios privados de procesos que ya no existen; devuelve cuántos"""
+    borrados = 0
+    for ruta in glob.glob(os.path.join(base or tempfile.gettempdir(), PREFIJO_DIRECTORIO + '*')):
+        coincidencia = re.fullmatch(PREFIJO_DIRECTORIO + r'(\d+)_\w+', os.path.basename(ruta))
+        if not coincidencia or ruta in _directorios_propios:
+            continue
+        pid = int(coincidencia.group(1))
+        # Un PID reutilizado por este mismo proceso (p. ej. tras reiniciar un contenedor) también es huérfano
+        if pid != os.getpid() and _proceso_vivo(pid):
+            continue
+        shutil.rmtree(ruta, ignore_errors=True)
+        borrados += 1
+    return borrados
+
+
+class MotorConsultas:
+    """Registro de tablas Parquet y ejecución de consultas SQL en proceso"""
+
+    def __init__(self, directorio=None, hilos=None):
+        self.directorio_fuentes = directorio or os.environ.get('DASHBOARD_DATOS_DIR')
+        self.disponible = duckdb is not None
+        self._tablas = {}
+        self._partes = {}
+        self._generaciones = {}
+        self._lock = threading.Lock()
+        if self.disponible:
+            if self.directorio_fuentes:
+                os.makedirs(self.directorio_fuentes, exist_ok=True)
+            limpiar_directorios_huerfanos(self.directorio_fuentes)
+            self.directorio = tempfile.mkdtemp(prefix=f'{PREFIJO_DIRECTORIO}{os.getpid()}_',
+                                               dir=self.directorio_fuentes)
+            _directorios_propios.add(self.directorio)
+            atexit.register(shutil.rmtree, self.directorio, True)
+            self._conexion = duckdb.connect(database=':memory:')
+            if hilos:
+                self._conexion.execute(f'SET threads = {int(hilos)}')
+
+    def registrar_tabla(self, nombre, df=None):
+        """Escribe `df` como Parquet (si se pasa) y expone la tabla como vista SQL.
+
+        Sin `df` se usan los ficheros existentes `<nombre>.parquet` o
+        `<nombre>/*.parquet` del directorio base, p. ej. datasets mayores que la RAM.
+        Con `df` la tabla se reescribe entera: para altas usar `agregar_filas`.
+        """
+        with self._lock:
+            if not self.disponible:
+                self._tablas[nombre] = df
+                return
+            if df is None:
+                if not self.directorio_fuentes:
+                    raise ValueError(f'No hay DASHBOARD_DATOS_DIR del que leer la tabla {nombre!r}')
+                ruta = os.path.join(self.directorio_fuentes, f'{nombre}.parquet')
+                if not os.path.exists(ruta):
+                    ruta = os.path.join(self.directorio_fuentes, nombre, '*.parquet')
+                self._crear_vista(nombre, ruta)
+                self._tablas[nombre] = ruta
+                self._partes.pop(nombre, None)
+            else:
+                # Solo se borran carpetas propias, nunca las fuentes del directorio base
+                anterior = self._tablas.get(nombre) if nombre in self._partes else None
+                self._nueva_generacion(nombre)
+                self._escribir_parte(nombre, df)
+                self._crear_vista(nombre, os.path.join(self._tablas[nombre], '*.parquet'))
+                if anterior:
+                    shutil.rmtree(anterior, ignore_errors=True)
+
+    def _crear_vista(self, nombre, ruta):
+        self._conexion.execute(
+            f"CREATE OR REPLACE VIEW \"{nombre}\" AS "
+            f"SELECT * FROM read_parquet('{ruta}', union_by_name = true)")
+
+    def _nueva_generacion(self, nombre):
+        """Carpeta nueva para la tabla; la anterior se borra tras cambiar la vista"""
+        generacion = self._generaciones.get(nombre, -1) + 1
+        self._generaciones[nombre] = generacion
+        carpeta = os.path.join(self.directorio, f'{nombre}.{generacion}')
+        os.makedirs(carpeta)
+        self._tablas[nombre] = carpeta
+        self._partes[nombre] = 0
+
+    def agregar_filas(self, nombre, df):
+        """Añade filas como un nuevo fichero parte, sin reescribir la tabla.
+
+        El coste por alta depende de las filas nuevas; cada MAX_PARTES partes
+        la tabla se compacta en un único fichero.
+        """
+        with self._lock:
+            if not self.disponible:
+                self._tablas[nombre] = pd.concat([self._tablas[nombre], df], ignore_index=True)
+                return
+            if nombre not in self._partes:
+                raise KeyError(f'La tabla {nombre!r} no se registró desde un DataFrame')
+            self._escribir_parte(nombre, df)
+            if self._partes[nombre] > MAX_PARTES:
+                self._compactar(nombre)
+
+    def _escribir_parte(self, nombre, df):
+        ruta = os.path.join(self._tablas[nombre], f'part-{self._partes[nombre]:05d}.parquet')
+        # duckdb no reconoce los np.str_ que deja np.random.choice en columnas object
+        df = df.assign(**{c: df[c].map(str, na_action='ignore')
+                          for c in df.select_dtypes('object').columns})
+        self._conexion.register('_origen', df)
+        try:
+            self._conexion.execute(f"COPY _origen TO '{ruta}.tmp' (FORMAT PARQUET)")
+        finally:
+            self._conexion.unregister('_origen')
+        os.replace(ruta + '.tmp', ruta)
+        self._partes[nombre] += 1
+
+    def _compactar(self, nombre):
+        # Se escribe en una generación nueva para que las consultas en curso
+        # nunca vean la tabla a medio compactar
+        anterior = self._tablas[nombre]
+        self._nueva_generacion(nombre)
+        compactado = os.path.join(self._tablas[nombre], 'part-00000.parquet')
+        self._conexion.execute(f"COPY (SELECT * FROM \"{nombre}\") TO '{compactado}' (FORMAT PARQUET)")
+        self._partes[nombre] = 1
+        self._crear_vista(nombre, os.path.join(self._tablas[nombre], '*.parquet'))
+        shutil.rmtree(anterior, ignore_errors=True)
+
+    def consultar(self, sql, parametros=None):
+        """Ejecuta una consulta y devuelve el resultado como DataFrame"""
+        if not self.disponible:
+            raise RuntimeError('duckdb no está instalado; usa las funciones de agregación de este módulo')
+        # Un cursor por llamada permite consultas concurrentes desde varios hilos
+        with self._lock:
+            cursor = self._conexion.cursor()
+        try:
+            return cursor.execute(sql, parametros or []).df()
+        finally:
+            cursor.close()
+
+    def tabla(self, nombre):
+        """DataFrame en memoria registrado (solo en modo pandas)"""
+        return self._tablas[nombre]
+
+
+# Agregaciones usadas por los gráficos del dashboard
+def tendencias_por_trimestre(motor, año=None, region=None):
+    """Tendencias, inversión y ROI por (Trimestre, Año) con filtros opcionales"""
+    if not motor.disponible:
+        df = motor.tabla('tendencias')
+        if año:
+            df = df[df['Año'] == año]
+        if region and region != 'Todas':
+            df = df[df['Region'] == region]
+        return df.groupby(['Trimestre', 'Año']).agg({
+            'Tendencias_Identificadas': 'sum',
+            'Inversión_Millones': 'sum',
+            'ROI_Esperado': 'mean'
+        }).reset_index()
+
+    condiciones, parametros = [], []
+    if año:
+        condiciones.append('"Año" = ?')
+        parametros.append(int(año))
+    if region and region != 'Todas':
+        condiciones.append('"Region" = ?')
+        parametros.append(region)
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ''
+    return motor.consultar(f'''
+        SELECT "Trimestre", "Año",
+               SUM("Tendencias_Identificadas") AS "Tendencias_Identificadas",
+               SUM("Inversión_Millones") AS "Inversión_Millones",
+               AVG("ROI_Esperado") AS "ROI_Esperado"
+        FROM tendencias
+        {where}
+        GROUP BY "Trimestre", "Año"
+        ORDER BY "Trimestre", "Año"
+    ''', parametros)
+
+
+def proyectos_por_estado(motor):
+    """Número de proyectos por estado (columnas Estado, count)"""
+    if not motor.disponible:
+        return motor.tabla('proyectos').groupby('Estado').size().reset_index(name='count')
+    return motor.consultar('''
+        SELECT "Estado", COUNT(*) AS count
+        FROM proyectos
+        GROUP BY "Estado"
+        ORDER BY "Estado"
+    ''')
+
+
+def contar_proyectos(motor, estados):
+    """Número de proyectos cuyo estado está en `estados`"""
+    estados = list(estados)
+    if not motor.disponible:
+        df = motor.tabla('proyectos')
+        return int(df['Estado'].isin(estados).sum())
+    marcadores = ', '.join('?' for _ in estados)
+    resultado = motor.consultar(
+        f'SELECT COUNT(*) AS n FROM proyectos WHERE "Estado" IN ({marcadores})', estados)
+    return int(resultado['n'].iloc[0])
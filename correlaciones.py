@@ -0,0 +1,112 @@
+# correlaciones.py
+"""Motor de correlaciones con actualización online de matrices de covarianza.
+
+Mantiene una covarianza expandida (todo el histórico) y otra sobre una ventana
+móvil. Cada fila nueva cuesta O(p²) en el número de KPIs, independientemente
+de la longitud del histórico. Una muestra reservorio de tamaño fijo sirve para
+dibujar el scatter de un par concreto sin enviar todos los puntos; en la vista
+móvil se dibujan directamente las filas de la ventana.
+"""
+from collections import deque
+
+import numpy as np
+
+
+class CovarianzaOnline:
+    """Media y co-momentos (Welford) con altas y bajas de observaciones"""
+
+    def __init__(self, p):
+        self.n = 0
+        self.media = np.zeros(p)
+        self.m2 = np.zeros((p, p))
+
+    def agregar(self, x):
+        self.n += 1
+        delta = x - self.media
+        self.media += delta / self.n
+        self.m2 += np.outer(delta, x - self.media)
+
+    def quitar(self, x):
+        if self.n <= 1:
+            self.__init__(len(self.media))
+            return
+        media_anterior = self.media - (x - self.media) / (self.n - 1)
+        self.m2 -= np.outer(x - media_anterior, x - self.media)
+        self.media = media_anterior
+        self.n -= 1
+
+    def covarianza(self):
+        if self.n < 2:
+            return np.full(self.m2.shape, np.nan)
+        return self.m2 / (self.n - 1)
+
+    def correlacion(self):
+        cov = self.covarianza()
+        desviacion = np.sqrt(np.clip(np.diag(cov), 0, None))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            corr = cov / np.outer(desviacion, desviacion)
+        return np.clip(corr, -1, 1)
+
+
+class MotorCorrelaciones:
+    """Correlaciones expandida y móvil de un conjunto fijo de columnas"""
+
+    def __init__(self, columnas, ventana=12, tamano_muestra=500, semilla=42):
+        self.columnas = list(columnas)
+        self.ventana = ventana
+        p = len(self.columnas)
+        self.expandida = CovarianzaOnline(p)
+        self.movil = CovarianzaOnline(p)
+        self._filas_ventana = deque()
+        self._bajas_desde_recalculo = 0
+        self.tamano_muestra = tamano_muestra
+        self.muestra = []
+        self._rng = np.random.default_rng(semilla)
+
+    def agregar_fila(self, fila):
+        """Incorpora una observación (dict o Series con las columnas del motor)"""
+        x = np.array([fila[c] for c in self.columnas], dtype=float)
+        if np.isnan(x).any():
+            return
+        self.expandida.agregar(x)
+
+        self._filas_ventana.append(x)
+        self.movil.agregar(x)
+        if len(self._filas_ventana) > self.ventana:
+            self.movil.quitar(self._filas_ventana.popleft())
+            self._bajas_desde_recalculo += 1
+            # Recalcular desde la ventana acota el error acumulado de las bajas
+            if self._bajas_desde_recalculo >= self.ventana:
+                self._recalcular_movil()
+
+        # Muestreo reservorio (algoritmo R) para el drill-down de pares
+        if len(self.muestra) < self.tamano_muestra:
+            self.muestra.append(x)
+        else:
+            j = self._rng.integers(0, self.expandida.n)
+            if j < self.tamano_muestra:
+                self.muestra[j] = x
+
+    def agregar_filas(self, df):
+        for fila in df[self.columnas].itertuples(index=False):
+            self.agregar_fila(dict(zip(self.columnas, fila)))
+
+    def _recalcular_movil(self):
+        self.movil = CovarianzaOnline(len(self.columnas))
+        for x in self._filas_ventana:
+            self.movil.agregar(x)
+        self._bajas_desde_recalculo = 0
+
+    def correlacion(self, tipo='expandida'):
+        """Matriz de correlación como array (p, p); tipo 'expandida' o 'movil'"""
+        estadisticos = self.movil if tipo == 'movil' else self.expandida
+        return estadisticos.correlacion()
+
+    def muestra_par(self, columna_x, columna_y, tipo='expandida'):
+        """Valores de dos columnas para el scatter de drill-down: la muestra
+        reservorio del histórico o, con tipo 'movil', las filas de la ventana"""
+        filas = list(self._filas_ventana) if tipo == 'movil' else self.muestra
+        if not filas:
+            return np.array([]), np.array([])
+        datos = np.vstack(filas)
+        return datos[:, self.columnas.index(columna_x)], datos[:, self.columnas.index(columna_y)]
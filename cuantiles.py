@@ -0,0 +1,169 @@
+# cuantiles.py
+"""Resúmenes de cuantiles mergeables (t-digest) para distribuciones agregadas.
+
+Permiten dibujar box plots e histogramas a partir de estadísticos en lugar de
+enviar todas las filas al navegador: el tamaño del resumen depende de la
+compresión, no del número de observaciones.
+"""
+import math
+from bisect import bisect_left, bisect_right
+
+
+class TDigest:
+    """t-digest con fusión por lotes (Dunning & Ertl) y función de escala k1"""
+
+    def __init__(self, compresion=100):
+        self.compresion = compresion
+        self.medias = []
+        self.pesos = []
+        self.total = 0.0
+        self.suma = 0.0
+        self.minimo = math.inf
+        self.maximo = -math.inf
+        self._buffer = []
+        self._limite_buffer = int(compresion * 5)
+
+    # Actualización
+    def agregar(self, valor, peso=1.0):
+        """Añade una observación; los puntos se comprimen por lotes"""
+        valor = float(valor)
+        if math.isnan(valor):
+            return
+        self._buffer.append((valor, float(peso)))
+        self.total += peso
+        self.suma += valor * peso
+        self.minimo = min(self.minimo, valor)
+        self.maximo = max(self.maximo, valor)
+        if len(self._buffer) >= self._limite_buffer:
+            self._comprimir()
+
+    def fusionar_valores(self, valores):
+        """Añade un lote de observaciones y devuelve el propio digest"""
+        for valor in valores:
+            self.agregar(valor)
+        self._comprimir()
+        return self
+
+    def fusionar(self, otro):
+        """Incorpora otro digest (los centroides se tratan como puntos ponderados)"""
+        otro._comprimir()
+        for media, peso in zip(otro.medias, otro.pesos):
+            self._buffer.append((media, peso))
+        self.total += otro.total
+        self.suma += otro.suma
+        self.minimo = min(self.minimo, otro.minimo)
+        self.maximo = max(self.maximo, otro.maximo)
+        self._comprimir()
+        return self
+
+    def copia(self):
+        """Copia comprimida e independiente, para consultarla sin compartir estado"""
+        self._comprimir()
+        otro = type(self)(self.compresion)
+        otro.medias, otro.pesos = list(self.medias), list(self.pesos)
+        otro.total, otro.suma = self.total, self.suma
+        otro.minimo, otro.maximo = self.minimo, self.maximo
+        return otro
+
+    @classmethod
+    def combinar(cls, digests, compresion=100):
+        """Nuevo digest resultado de fusionar varios sin modificarlos"""
+        resultado = cls(compresion)
+        for d in digests:
+            resultado.fusionar(d)
+        return resultado
+
+    def _k(self, q):
+        return self.compresion / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _comprimir(self):
+        if not self._buffer:
+            return
+        puntos = sorted(list(zip(self.medias, self.pesos)) + self._buffer)
+        self._buffer = []
+        total = sum(p for _, p in puntos)
+        medias, pesos = [puntos[0][0]], [puntos[0][1]]
+        acumulado = 0.0
+        k_inicio = self._k(0.0)
+        for media, peso in puntos[1:]:
+            q = (acumulado + pesos[-1] + peso) / total
+            if self._k(q) - k_inicio <= 1:
+                pesos[-1] += peso
+                medias[-1] += (media - medias[-1]) * peso / pesos[-1]
+            else:
+                acumulado += pesos[-1]
+                k_inicio = self._k(acumulado / total)
+                medias.append(media)
+                pesos.append(peso)
+        self.medias, self.pesos = medias, pesos
+
+    # Consultas
+    @property
+    def media(self):
+        return self.suma / self.total if self.total else math.nan
+
+    def cuantil(self, q):
+        """Cuantil aproximado q en [0, 1] interpolando entre centroides"""
+        self._comprimir()
+        if not self.total:
+            return math.nan
+        if q <= 0:
+            return self.minimo
+        if q >= 1:
+            return self.maximo
+        objetivo = q * self.total
+        # Posición (en peso acumulado) del centro de cada centroide
+        centros, acumulado = [], 0.0
+        for peso in self.pesos:
+            centros.append(acumulado + peso / 2)
+            acumulado += peso
+        if objetivo <= centros[0]:
+            return self._interpolar(objetivo, 0.0, centros[0], self.minimo, self.medias[0])
+        if objetivo >= centros[-1]:
+            return self._interpolar(objetivo, centros[-1], self.total, self.medias[-1], self.maximo)
+        i = bisect_right(centros, objetivo) - 1
+        return self._interpolar(objetivo, centros[i], centros[i + 1], self.medias[i], self.medias[i + 1])
+
+    def cdf(self, valor):
+        """Fracción aproximada de observaciones <= valor"""
+        self._comprimir()
+        if not self.total or valor < self.minimo:
+            return 0.0
+        if valor >= self.maximo:
+            return 1.0
+        puntos_x = [self.minimo] + self.medias + [self.maximo]
+        puntos_w, acumulado = [0.0], 0.0
+        for peso in self.pesos:
+            puntos_w.append(acumulado + peso / 2)
+            acumulado += peso
+        puntos_w.append(self.total)
+        i = max(1, bisect_left(puntos_x, valor))
+        return self._interpolar(valor, puntos_x[i - 1], puntos_x[i], puntos_w[i - 1], puntos_w[i]) / self.total
+
+    @staticmethod
+    def _interpolar(x, x0, x1, y0, y1):
+        if x1 == x0:
+            return (y0 + y1) / 2
+        return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+
+    def resumen_box(self):
+        """Estadísticos para go.Box: cuartiles, media y bigotes de Tukey"""
+        q1, mediana, q3 = self.cuantil(0.25), self.cuantil(0.5), self.cuantil(0.75)
+        iqr = q3 - q1
+        return {
+            'q1': q1,
+            'median': mediana,
+            'q3': q3,
+            'mean': self.media,
+            'lowerfence': max(self.minimo, q1 - 1.5 * iqr),
+            'upperfence': min(self.maximo, q3 + 1.5 * iqr),
+            'n': int(self.total)
+        }
+
+    def histograma(self, bordes):
+        """Conteos aproximados por intervalo a partir de la CDF"""
+        acumulados = [self.cdf(b) * self.total for b in bordes]
+        return [max(0.0, b - a) for a, b in zip(acumulados[:-1], acumulados[1:])]
+
+    def __len__(self):
+        return int(self.total)
@@ -9,11 +9,33 @@ from datetime import datetime, timedelta
 import json
 import base64
 import io
+import os
+import threading
+
+import flask
+
+from coalescencia import SingleFlight
+from consultas import MotorConsultas, contar_proyectos, proyectos_por_estado, tendencias_por_trimestre
+from correlaciones import MotorCorrelaciones
+from cuantiles import TDigest
+from perfilado import instalar_perfilado
 
 # Configuración de la app con tema personalizado
-app = dash.Dash(__name__)
+app = dash.Dash(__name__, suppress_callback_exceptions=True)
 app.title = "Huawei BI Analytics Dashboard"
 
+# Perfilado bajo demanda de callbacks lentos, inactivo salvo que se habilite por entorno
+instalar_perfilado(app.server)
+
+# Coalescencia de callbacks idénticos concurrentes; DASHBOARD_COALESCENCIA_DIR
+# (directorio compartido entre workers, privado del servicio con permisos 0700)
+# la extiende a todos los workers de gunicorn
+single_flight = SingleFlight(os.environ.get('DASHBOARD_COALESCENCIA_DIR'))
+
+@app.server.route('/_metricas/coalescencia')
+def metricas_coalescencia():
+    return flask.jsonify(single_flight.metricas())
+
 # Datos simulados expandidos y realistas
 np.random.seed(42)
 
@@ -94,20 +116,103 @@ for fecha in fechas:
     })
 df_kpis = pd.DataFrame(kpis_data)
 
-# 5. Datos de benchmark competitivo
+# 5. Datos de benchmark competitivo (trimestral)
 competidores = ['Huawei', 'Ericsson', 'Nokia', 'Samsung', 'Cisco', 'ZTE']
+periodos_benchmark = pd.date_range(start=fechas[0], end=fechas[-1], freq='QE')
 benchmark_data = []
-for comp in competidores:
-    benchmark_data.append({
-        'Empresa': comp,
-        'Market_Share': np.random.uniform(0.08, 0.25) if comp == 'Huawei' else np.random.uniform(0.05, 0.2),
-        'Innovation_Index': np.random.uniform(0.6, 0.95) if comp == 'Huawei' else np.random.uniform(0.5, 0.85),
-        'Customer_Satisfaction': np.random.uniform(75, 90) if comp == 'Huawei' else np.random.uniform(65, 85),
-        'R&D_Investment_Billions': np.random.uniform(8, 15) if comp == 'Huawei' else np.random.uniform(3, 12),
-        'Patents_Filed': np.random.randint(800, 2000) if comp == 'Huawei' else np.random.randint(200, 1500)
-    })
+for periodo in periodos_benchmark:
+    for comp in competidores:
+        benchmark_data.append({
+            'Periodo': periodo,
+            'Empresa': comp,
+            'Market_Share': np.random.uniform(0.08, 0.25) if comp == 'Huawei' else np.random.uniform(0.05, 0.2),
+            'Innovation_Index': np.random.uniform(0.6, 0.95) if comp == 'Huawei' else np.random.uniform(0.5, 0.85),
+            'Customer_Satisfaction': np.random.uniform(75, 90) if comp == 'Huawei' else np.random.uniform(65, 85),
+            'R&D_Investment_Billions': np.random.uniform(8, 15) if comp == 'Huawei' else np.random.uniform(3, 12),
+            'Patents_Filed': np.random.randint(800, 2000) if comp == 'Huawei' else np.random.randint(200, 1500)
+        })
 df_benchmark = pd.DataFrame(benchmark_data)
 
+# Motor SQL embebido sobre Parquet para filtros y agregaciones (ficheros privados de cada worker)
+motor_consultas = MotorConsultas()
+motor_consultas.registrar_tabla('tendencias', df_tendencias_hist)
+motor_consultas.registrar_tabla('proyectos', df_proyectos)
+
+# Cache de figuras precomputadas, invalidada por versión de datos
+_version_datos = {'tech_performance': 0, 'proyectos': 0, 'kpis': 0, 'benchmark': 0}
+_cache_figuras = {}
+_lock_datos = threading.Lock()
+
+def registrar_actualizacion_datos(nombre):
+    """Incrementa la versión de un dataset para invalidar sus figuras cacheadas"""
+    with _lock_datos:
+        _version_datos[nombre] += 1
+
+def obtener_figura_cacheada(figura, dataset, constructor):
+    """Devuelve la figura cacheada para la versión actual del dataset o la construye"""
+    version = _version_datos[dataset]
+    fig = _cache_figuras.get(figura)
+    if fig is None or fig[0] != version:
+        fig = (version, constructor())
+        with _lock_datos:
+            _cache_figuras[figura] = fig
+    return fig[1]
+
+# Resúmenes de cuantiles del progreso por (Departamento, Prioridad)
+def _construir_resumen_progreso():
+    """Un t-digest por grupo, en una sola pasada agrupada sobre los proyectos"""
+    return {
+        grupo: TDigest().fusionar_valores(datos['Progreso'].to_numpy())
+        for grupo, datos in df_proyectos.groupby(['Departamento', 'Prioridad'])
+    }
+
+_resumen_progreso = _construir_resumen_progreso()
+
+def agregar_proyecto(proyecto):
+    """Añade un proyecto y actualiza incrementalmente el digest de su grupo"""
+    global df_proyectos
+    with _lock_datos:
+        df_proyectos = pd.concat([df_proyectos, pd.DataFrame([proyecto])], ignore_index=True)
+        grupo = (proyecto['Departamento'], proyecto['Prioridad'])
+        _resumen_progreso.setdefault(grupo, TDigest()).agregar(proyecto['Progreso'])
+        motor_consultas.agregar_filas('proyectos', pd.DataFrame([proyecto]))
+    registrar_actualizacion_datos('proyectos')
+
+def actualizar_proyecto(id_proyecto, **cambios):
+    """Modifica un proyecto; el t-digest no admite borrados, así que se
+    reconstruyen solo los grupos afectados (el anterior y el nuevo). La tabla
+    Parquet se reescribe entera, por lo que el coste crece con su tamaño"""
+    with _lock_datos:
+        fila = df_proyectos.index[df_proyectos['ID_Proyecto'] == id_proyecto]
+        if fila.empty:
+            raise KeyError(id_proyecto)
+        afectados = {tuple(df_proyectos.loc[fila[0], ['Departamento', 'Prioridad']])}
+        for columna, valor in cambios.items():
+            df_proyectos.loc[fila, columna] = valor
+        afectados.add(tuple(df_proyectos.loc[fila[0], ['Departamento', 'Prioridad']]))
+        for departamento, prioridad in afectados:
+            valores = df_proyectos.loc[(df_proyectos['Departamento'] == departamento) &
+                                       (df_proyectos['Prioridad'] == prioridad), 'Progreso']
+            if valores.empty:
+                _resumen_progreso.pop((departamento, prioridad), None)
+            else:
+                _resumen_progreso[(departamento, prioridad)] = TDigest().fusionar_valores(valores.to_numpy())
+        motor_consultas.registrar_tabla('proyectos', df_proyectos)
+    registrar_actualizacion_datos('proyectos')
+
+# Motor de correlaciones online sobre todas las columnas de KPIs
+COLUMNAS_KPIS = [c for c in df_kpis.columns if c != 'Fecha']
+motor_correlaciones = MotorCorrelaciones(COLUMNAS_KPIS, ventana=12)
+motor_correlaciones.agregar_filas(df_kpis)
+
+def agregar_kpis(fila):
+    """Añade un período de KPIs y actualiza las covarianzas en O(p²)"""
+    global df_kpis
+    with _lock_datos:
+        df_kpis = pd.concat([df_kpis, pd.DataFrame([fila])], ignore_index=True)
+        motor_correlaciones.agregar_fila(fila)
+    registrar_actualizacion_datos('kpis')
+
 # Funciones auxiliares para análisis avanzado
 def calcular_alertas():
     """Genera alertas inteligentes basadas en KPIs"""
@@ -151,21 +256,10 @@ def generar_insights():
 # Funciones para crear gráficos avanzados
 def crear_grafico_tendencias_avanzado(año_filtro=None, region_filtro=None):
     """Gráfico de tendencias con filtros y análisis predictivo"""
-    df_filtrado = df_tendencias_hist.copy()
-    
-    if año_filtro:
-        df_filtrado = df_filtrado[df_filtrado['Año'] == año_filtro]
-    if region_filtro and region_filtro != 'Todas':
-        df_filtrado = df_filtrado[df_filtrado['Region'] == region_filtro]
-    
     fig = go.Figure()
     
-    # Tendencias por trimestre
-    df_trim = df_filtrado.groupby(['Trimestre', 'Año']).agg({
-        'Tendencias_Identificadas': 'sum',
-        'Inversión_Millones': 'sum',
-        'ROI_Esperado': 'mean'
-    }).reset_index()
+    # Tendencias por trimestre, filtradas y agregadas en el motor SQL
+    df_trim = tendencias_por_trimestre(motor_consultas, año=año_filtro, region=region_filtro)
     
     df_trim['Periodo'] = df_trim['Año'].astype(str) + '-' + df_trim['Trimestre']
     
@@ -207,25 +301,105 @@ def crear_grafico_tendencias_avanzado(año_filtro=None, region_filtro=None):
     return fig
 
 def crear_matriz_riesgo_oportunidad():
-    """Matriz de riesgo vs oportunidad para tecnologías"""
-    df_actual = df_tech_performance[df_tech_performance['Fecha'] == df_tech_performance['Fecha'].max()]
-    
-    fig = px.scatter(
-        df_actual,
-        x='Madurez_Tecnologica',
-        y='Potencial_Futuro',
-        size='Inversion_Actual',
-        color='Adopcion_Mercado',
-        hover_name='Tecnologia',
-        hover_data={
-            'Impacto_Actual': ':.1f',
-            'Competitividad': ':.2f',
-            'Satisfaccion_Cliente': ':.1f'
-        },
-        color_continuous_scale='Viridis',
-        title='🎯 Matriz Estratégica: Riesgo vs Oportunidad por Tecnología'
+    """Matriz de riesgo vs oportunidad animada por período, cacheada por versión de datos"""
+    return obtener_figura_cacheada('matriz_riesgo_oportunidad', 'tech_performance',
+                                   _construir_matriz_riesgo_oportunidad)
+
+def _construir_matriz_riesgo_oportunidad():
+    """Construye la matriz con un frame de animación por mes en una sola pasada agrupada"""
+    df = df_tech_performance.sort_values(['Fecha', 'Tecnologia'])
+
+    # Escalas fijas para que los frames sean comparables entre sí
+    inversion_max = max(df['Inversion_Actual'].max(), 1e-9)
+    color_min, color_max = df['Adopcion_Mercado'].min(), df['Adopcion_Mercado'].max()
+    x_min, x_max = df['Madurez_Tecnologica'].min(), df['Madurez_Tecnologica'].max()
+    y_min, y_max = df['Potencial_Futuro'].min(), df['Potencial_Futuro'].max()
+    margen_x, margen_y = (x_max - x_min) * 0.1, (y_max - y_min) * 0.1
+
+    hovertemplate = ('<b>%{hovertext}</b><br>' +
+                     'Madurez: %{x:.2f}<br>' +
+                     'Potencial: %{y:.1f}<br>' +
+                     'Impacto Actual: %{customdata[0]:.1f}<br>' +
+                     'Competitividad: %{customdata[1]:.2f}<br>' +
+                     'Satisfacción Cliente: %{customdata[2]:.1f}<extra></extra>')
+
+    # Frames compactos: solo datos numéricos en float32, el layout se comparte
+    frames = []
+    for fecha, grupo in df.groupby('Fecha', sort=True):
+        frames.append(go.Frame(
+            name=fecha.strftime('%Y-%m'),
+            data=[go.Scatter(
+                x=grupo['Madurez_Tecnologica'].to_numpy(np.float32),
+                y=grupo['Potencial_Futuro'].to_numpy(np.float32),
+                ids=grupo['Tecnologia'].tolist(),
+                hovertext=grupo['Tecnologia'].tolist(),
+                customdata=grupo[['Impacto_Actual', 'Competitividad', 'Satisfaccion_Cliente']].to_numpy(np.float32),
+                marker=dict(
+                    size=grupo['Inversion_Actual'].clip(lower=0).to_numpy(np.float32),
+                    color=grupo['Adopcion_Mercado'].to_numpy(np.float32)
+                )
+            )]
+        ))
+
+    # El estado inicial es el último período, como en la vista original
+    ultimo = frames[-1].data[0]
+    fig = go.Figure(
+        data=[go.Scatter(
+            x=ultimo.x,
+            y=ultimo.y,
+            ids=ultimo.ids,
+            hovertext=ultimo.hovertext,
+            customdata=ultimo.customdata,
+            mode='markers',
+            hovertemplate=hovertemplate,
+            marker=dict(
+                size=ultimo.marker.size,
+                sizemode='area',
+                sizeref=2. * inversion_max / (40. ** 2),
+                sizemin=4,
+                color=ultimo.marker.color,
+                cmin=color_min,
+                cmax=color_max,
+                colorscale='Viridis',
+                colorbar=dict(title='Adopcion_Mercado'),
+                line=dict(width=1, color='DarkSlateGrey')
+            )
+        )],
+        frames=frames
     )
-    
+
+    # Controles de reproducción y slider, todo en el cliente sin callbacks
+    animacion = {'frame': {'duration': 600, 'redraw': False}, 'transition': {'duration': 300}, 'fromcurrent': True}
+    fig.update_layout(
+        title='🎯 Matriz Estratégica: Riesgo vs Oportunidad por Tecnología',
+        yaxis_range=[y_min - margen_y, y_max + margen_y],
+        xaxis_range=[x_min - margen_x, x_max + margen_x],
+        margin=dict(b=140),
+        updatemenus=[{
+            'type': 'buttons',
+            'direction': 'left',
+            'x': 0.1, 'y': -0.12,
+            'xanchor': 'right', 'yanchor': 'top',
+            'showactive': False,
+            'buttons': [
+                {'label': '▶', 'method': 'animate', 'args': [None, animacion]},
+                {'label': '⏸', 'method': 'animate',
+                 'args': [[None], {'frame': {'duration': 0, 'redraw': False}, 'mode': 'immediate'}]}
+            ]
+        }],
+        sliders=[{
+            'active': len(frames) - 1,
+            'x': 0.1, 'y': -0.05, 'len': 0.9,
+            'currentvalue': {'prefix': 'Período: '},
+            'steps': [
+                {'label': f.name, 'method': 'animate',
+                 'args': [[f.name], {'mode': 'immediate', 'frame': {'duration': 0, 'redraw': False},
+                                     'transition': {'duration': 0}}]}
+                for f in frames
+            ]
+        }]
+    )
+
     # Añadir cuadrantes
     fig.add_hline(y=70, line_dash="dash", line_color="gray", opacity=0.5)
     fig.add_vline(x=0.6, line_dash="dash", line_color="gray", opacity=0.5)
@@ -302,31 +476,92 @@ def crear_dashboard_kpis():
     
     return fig
 
-def crear_analisis_competitivo():
+# Benchmark competitivo normalizado por período
+METRICAS_BENCHMARK = {
+    'Market_Share': 'Market Share',
+    'Innovation_Index': 'Innovation Index',
+    'Customer_Satisfaction': 'Customer Satisfaction',
+    'R&D_Investment_Billions': 'R&D Investment',
+    'Patents_Filed': 'Patents Filed'
+}
+
+def obtener_benchmark_normalizado(normalizacion='percentil'):
+    """Benchmark con una columna `<métrica>_Norm` (0-100) por métrica, cacheado por versión"""
+    return obtener_figura_cacheada(f'benchmark_normalizado_{normalizacion}', 'benchmark',
+                                   lambda: _normalizar_benchmark(normalizacion))
+
+def _normalizar_benchmark(normalizacion):
+    """Normaliza todas las métricas dentro de cada período en una sola pasada vectorizada"""
+    metricas = list(METRICAS_BENCHMARK)
+    grupos = df_benchmark.groupby('Periodo')[metricas]
+    if normalizacion == 'percentil':
+        normalizado = grupos.rank(pct=True) * 100
+    else:
+        minimo, maximo = grupos.transform('min'), grupos.transform('max')
+        normalizado = (df_benchmark[metricas] - minimo) / (maximo - minimo).replace(0, np.nan) * 100
+        # Una métrica constante en el período puntúa 100; un dato ausente sigue siendo NaN
+        constante = (maximo == minimo) & df_benchmark[metricas].notna()
+        normalizado = normalizado.mask(constante, 100)
+    return pd.concat([df_benchmark, normalizado.add_suffix('_Norm')], axis=1)
+
+# Rango del slider de competidores mostrados
+TOP_K_MIN, TOP_K_MAX = 3, 20
+
+def normalizar_seleccion_benchmark(periodo=None, top_k=10):
+    """Período canónico ('%Y-%m-%d') y top-K acotado; PreventUpdate si el período no existe"""
+    if periodo:
+        try:
+            periodo = pd.Timestamp(periodo)
+        except (TypeError, ValueError):
+            raise dash.exceptions.PreventUpdate
+        if not (df_benchmark['Periodo'] == periodo).any():
+            raise dash.exceptions.PreventUpdate
+    else:
+        periodo = df_benchmark['Periodo'].max()
+    try:
+        top_k = int(top_k)
+    except (TypeError, ValueError):
+        top_k = 10
+    return periodo.strftime('%Y-%m-%d'), min(max(top_k, TOP_K_MIN), TOP_K_MAX)
+
+def seleccionar_benchmark(periodo=None, top_k=10, normalizacion='percentil'):
+    """Top-K competidores por market share en un período (Huawei siempre incluido)"""
+    df = obtener_benchmark_normalizado(normalizacion)
+    periodo = pd.Timestamp(periodo) if periodo else df['Periodo'].max()
+    df_periodo = df[df['Periodo'] == periodo]
+    top = df_periodo.nlargest(top_k, 'Market_Share')
+    if not (top['Empresa'] == 'Huawei').any():
+        top = pd.concat([top.iloc[:max(top_k - 1, 0)], df_periodo[df_periodo['Empresa'] == 'Huawei']])
+    return top
+
+def crear_analisis_competitivo(periodo=None, top_k=10):
     """Análisis competitivo radar avanzado"""
+    periodo, top_k = normalizar_seleccion_benchmark(periodo, top_k)
+    return obtener_figura_cacheada(f'radar_competitivo_{periodo}_{top_k}', 'benchmark',
+                                   lambda: _construir_analisis_competitivo(periodo, top_k))
+
+def _construir_analisis_competitivo(periodo, top_k):
+    df_top = seleccionar_benchmark(periodo, top_k)
     fig = go.Figure()
     
-    categorias = ['Market Share', 'Innovation Index', 'Customer Satisfaction', 'R&D Investment', 'Patents Filed']
-    
-    for empresa in df_benchmark['Empresa']:
-        empresa_data = df_benchmark[df_benchmark['Empresa'] == empresa].iloc[0]
-        valores = [
-            empresa_data['Market_Share'] * 100,
-            empresa_data['Innovation_Index'] * 100,
-            empresa_data['Customer_Satisfaction'],
-            (empresa_data['R&D_Investment_Billions'] / 15) * 100,  # Normalizado
-            (empresa_data['Patents_Filed'] / 2000) * 100  # Normalizado
-        ]
-        
+    categorias = list(METRICAS_BENCHMARK.values())
+    columnas_norm = [f'{m}_Norm' for m in METRICAS_BENCHMARK]
+    valores = df_top[columnas_norm].to_numpy()
+    originales = df_top[list(METRICAS_BENCHMARK)].to_numpy()
+    
+    for empresa, fila, original in zip(df_top['Empresa'], valores, originales):
         fig.add_trace(go.Scatterpolar(
-            r=valores + [valores[0]],
+            r=np.append(fila, fila[0]),
             theta=categorias + [categorias[0]],
+            customdata=np.append(original, original[0]),
+            hovertemplate='<b>' + empresa + '</b><br>%{theta}: %{customdata:.3~f} (%{r:.0f}/100)<extra></extra>',
             fill='toself' if empresa == 'Huawei' else 'none',
             name=empresa,
             line=dict(width=3 if empresa == 'Huawei' else 1),
             fillcolor='rgba(31, 119, 180, 0.3)' if empresa == 'Huawei' else None
         ))
     
+    periodo_titulo = df_top['Periodo'].max()
     fig.update_layout(
         polar=dict(
             radialaxis=dict(
@@ -335,13 +570,181 @@ def crear_analisis_competitivo():
                 tickfont=dict(size=10)
             )
         ),
-        title='🏆 Análisis Competitivo - Posicionamiento en el Mercado',
+        title=f'🏆 Análisis Competitivo - Posicionamiento en el Mercado ({periodo_titulo:%Y}-Q{periodo_titulo.quarter}, percentil)',
         template='plotly_white',
         height=600
     )
     
     return fig
 
+def crear_market_share_competidores(periodo=None, top_k=10):
+    """Market share de los top-K competidores del período"""
+    periodo, top_k = normalizar_seleccion_benchmark(periodo, top_k)
+    return obtener_figura_cacheada(f'market_share_{periodo}_{top_k}', 'benchmark', lambda: px.bar(
+        seleccionar_benchmark(periodo, top_k).sort_values('Market_Share', ascending=True),
+        x='Market_Share',
+        y='Empresa',
+        title='📊 Market Share por Competidor',
+        orientation='h',
+        color='Market_Share',
+        color_continuous_scale='viridis'
+    ))
+
+def crear_scatter_id_competidores(periodo=None, top_k=10):
+    """I+D vs innovación vs patentes de los top-K competidores del período"""
+    periodo, top_k = normalizar_seleccion_benchmark(periodo, top_k)
+    return obtener_figura_cacheada(f'scatter_id_{periodo}_{top_k}', 'benchmark', lambda: px.scatter(
+        seleccionar_benchmark(periodo, top_k),
+        x='R&D_Investment_Billions',
+        y='Innovation_Index',
+        size='Patents_Filed',
+        color='Customer_Satisfaction',
+        hover_name='Empresa',
+        title='🔬 I+D vs Innovación vs Patentes',
+        labels={'R&D_Investment_Billions': 'Inversión I+D (B$)', 'Innovation_Index': 'Índice de Innovación'}
+    ))
+
+COLORES_PRIORIDAD = dict(zip(['Alta', 'Media', 'Baja'], px.colors.qualitative.Plotly))
+
+def _instantanea_resumen_progreso():
+    """Copia de los digest tomada bajo el lock; cuantil y cdf los modifican al comprimir"""
+    with _lock_datos:
+        return {grupo: digest.copia() for grupo, digest in _resumen_progreso.items()}
+
+def _prioridades_con_datos(resumen):
+    presentes = {p for _, p in resumen}
+    return [p for p in COLORES_PRIORIDAD if p in presentes] + sorted(presentes - set(COLORES_PRIORIDAD))
+
+def crear_box_progreso():
+    """Box plot de progreso por departamento a partir de los t-digest, no de las filas"""
+    return obtener_figura_cacheada('box_progreso', 'proyectos', _construir_box_progreso)
+
+def _construir_box_progreso():
+    resumen = _instantanea_resumen_progreso()
+    fig = go.Figure()
+    for prioridad in _prioridades_con_datos(resumen):
+        grupos = sorted((d, digest) for (d, p), digest in resumen.items() if p == prioridad)
+        resumenes = [digest.resumen_box() for _, digest in grupos]
+        fig.add_trace(go.Box(
+            name=prioridad,
+            x=[d for d, _ in grupos],
+            q1=[r['q1'] for r in resumenes],
+            median=[r['median'] for r in resumenes],
+            q3=[r['q3'] for r in resumenes],
+            mean=[r['mean'] for r in resumenes],
+            lowerfence=[r['lowerfence'] for r in resumenes],
+            upperfence=[r['upperfence'] for r in resumenes],
+            marker_color=COLORES_PRIORIDAD.get(prioridad)
+        ))
+
+    fig.update_layout(
+        title='📈 Progreso por Departamento',
+        xaxis_title='Departamento',
+        yaxis_title='Progreso',
+        legend_title='Prioridad',
+        boxmode='group',
+        template='plotly_white'
+    )
+
+    return fig
+
+def crear_histograma_progreso(ancho_bin=10):
+    """Histograma de progreso por prioridad fusionando los digest de cada departamento"""
+    return obtener_figura_cacheada(f'histograma_progreso_{ancho_bin}', 'proyectos',
+                                   lambda: _construir_histograma_progreso(ancho_bin))
+
+def _construir_histograma_progreso(ancho_bin):
+    bordes = list(range(0, 100 + ancho_bin, ancho_bin))
+    centros = [(a + b) / 2 for a, b in zip(bordes[:-1], bordes[1:])]
+    resumen = _instantanea_resumen_progreso()
+    fig = go.Figure()
+    for prioridad in _prioridades_con_datos(resumen):
+        digest = TDigest.combinar(d for (_, p), d in resumen.items() if p == prioridad)
+        fig.add_trace(go.Bar(
+            name=prioridad,
+            x=centros,
+            y=np.round(digest.histograma(bordes), 1),
+            width=ancho_bin,
+            marker_color=COLORES_PRIORIDAD.get(prioridad),
+            opacity=0.6,
+            hovertemplate='Progreso %{x:.0f}%: ~%{y:.0f} proyectos<extra></extra>'
+        ))
+
+    fig.update_layout(
+        title='📊 Distribución del Progreso por Prioridad',
+        xaxis_title='Progreso (%)',
+        yaxis_title='Proyectos',
+        legend_title='Prioridad',
+        barmode='overlay',
+        template='plotly_white'
+    )
+
+    return fig
+
+def crear_heatmap_correlaciones(tipo='expandida'):
+    """Heatmap de correlaciones entre KPIs calculado desde las covarianzas online"""
+    return obtener_figura_cacheada(f'heatmap_correlaciones_{tipo}', 'kpis',
+                                   lambda: _construir_heatmap_correlaciones(tipo))
+
+def _construir_heatmap_correlaciones(tipo):
+    corr = motor_correlaciones.correlacion(tipo)
+    etiquetas = [c.replace('_', ' ') for c in COLUMNAS_KPIS]
+    titulo = ('Histórico completo' if tipo == 'expandida'
+              else f'Últimos {motor_correlaciones.ventana} períodos')
+
+    fig = go.Figure(go.Heatmap(
+        z=np.round(corr, 3),
+        x=etiquetas,
+        y=etiquetas,
+        customdata=np.array([[[cx, cy] for cx in COLUMNAS_KPIS] for cy in COLUMNAS_KPIS]),
+        zmin=-1,
+        zmax=1,
+        colorscale='RdBu',
+        reversescale=True,
+        hovertemplate='%{y} vs %{x}<br>Correlación: %{z:.2f}<extra></extra>'
+    ))
+
+    fig.update_layout(
+        title=f'Matriz de Correlaciones - {titulo} (clic para ver el par)',
+        template='plotly_white',
+        height=600,
+        yaxis_autorange='reversed'
+    )
+
+    return fig
+
+# Par mostrado en el drill-down hasta que se pulsa una celda del heatmap
+PAR_KPIS_INICIAL = ('Tiempo_Respuesta_Dias', 'Satisfaccion_Cliente')
+
+def crear_scatter_par_kpis(columna_x, columna_y, tipo='expandida'):
+    """Scatter de un par de KPIs con los mismos puntos sobre los que se calcula su r"""
+    i, j = COLUMNAS_KPIS.index(columna_x), COLUMNAS_KPIS.index(columna_y)
+    with _lock_datos:
+        x, y = motor_correlaciones.muestra_par(columna_x, columna_y, tipo)
+        corr = motor_correlaciones.correlacion(tipo)[j, i]
+    if tipo == 'expandida':
+        etiqueta_r, etiqueta_n = 'r', 'muestreados'
+    else:
+        etiqueta_r, etiqueta_n = f'r últimos {motor_correlaciones.ventana}', 'períodos'
+
+    fig = go.Figure(go.Scatter(
+        x=x,
+        y=y,
+        mode='markers',
+        marker=dict(size=8, color='rgba(55, 128, 191, 0.7)'),
+        hovertemplate=f'{columna_x}: %{{x:.2f}}<br>{columna_y}: %{{y:.2f}}<extra></extra>'
+    ))
+
+    fig.update_layout(
+        title=f'🔍 {columna_x} vs {columna_y} ({etiqueta_r} = {corr:.2f}, n = {len(x)} {etiqueta_n})',
+        xaxis_title=columna_x,
+        yaxis_title=columna_y,
+        template='plotly_white',
+        height=450
+    )
+
+    return fig
+
 def crear_tabla_proyectos():
     """Tabla interactiva de proyectos con filtros"""
     df_tabla = df_proyectos.copy()
@@ -571,6 +974,7 @@ def update_insights(n_clicks):
      Input('date-picker-range', 'start_date'),
      Input('date-picker-range', 'end_date')]
 )
+@single_flight.coalescer
 def update_dashboard_content(vista, region, start_date, end_date):
     if vista == 'executive':
         return html.Div([
@@ -590,10 +994,10 @@ def update_dashboard_content(vista, region, start_date, end_date):
                 
                 # Card 2: Proyectos Activos
                 html.Div([
-                    html.H4(f'{len(df_proyectos[df_proyectos["Estado"].isin(["En Proceso", "Aprobado"])])}', 
+                    html.H4(f'{contar_proyectos(motor_consultas, ["En Proceso", "Aprobado"])}', 
                            style={'color': '#007bff', 'fontSize': '2.5rem', 'margin': '0'}),
                     html.P('Proyectos Activos', style={'color': '#666', 'margin': '5px 0'}),
-                    html.P(f'{len(df_proyectos[df_proyectos["Estado"] == "Completado"])} completados este mes', 
+                    html.P(f'{contar_proyectos(motor_consultas, ["Completado"])} completados este mes', 
                            style={'color': '#007bff', 'fontSize': '0.9rem', 'margin': '0'})
                 ], className='metric-card'),
                 
@@ -649,13 +1053,19 @@ def update_dashboard_content(vista, region, start_date, end_date):
             # Análisis de correlaciones
             html.Div([
                 html.H3('📊 Análisis de Correlaciones Clave', style={'color': '#2c3e50'}),
-                dcc.Graph(
-                    figure=px.scatter_matrix(
-                        df_kpis[['Tiempo_Respuesta_Dias', 'Satisfaccion_Cliente', 'Eficiencia_Operacional', 'Revenue_Impacto_Millones']].tail(50),
-                        title='Matriz de Correlaciones - Últimos 50 períodos',
-                        height=600
-                    )
-                )
+                dcc.RadioItems(
+                    id='tipo-correlacion',
+                    options=[
+                        {'label': 'Histórico completo', 'value': 'expandida'},
+                        {'label': f'Ventana móvil ({motor_correlaciones.ventana} períodos)', 'value': 'movil'}
+                    ],
+                    value='expandida',
+                    inline=True,
+                    style={'marginBottom': '10px'}
+                ),
+                dcc.Graph(id='heatmap-correlaciones', figure=crear_heatmap_correlaciones()),
+                dcc.Graph(id='scatter-par-kpis',
+                          figure=crear_scatter_par_kpis(*PAR_KPIS_INICIAL))
             ], style={'margin': '20px 0'})
         ])
     
@@ -668,7 +1078,7 @@ def update_dashboard_content(vista, region, start_date, end_date):
                 html.Div([
                     dcc.Graph(
                         figure=px.pie(
-                            df_proyectos.groupby('Estado').size().reset_index(name='count'),
+                            proyectos_por_estado(motor_consultas),
                             values='count',
                             names='Estado',
                             title='🎯 Distribución de Proyectos por Estado',
@@ -678,18 +1088,15 @@ def update_dashboard_content(vista, region, start_date, end_date):
                 ], style={'width': '50%', 'display': 'inline-block'}),
                 
                 html.Div([
-                    dcc.Graph(
-                        figure=px.box(
-                            df_proyectos,
-                            x='Departamento',
-                            y='Progreso',
-                            title='📈 Progreso por Departamento',
-                            color='Prioridad'
-                        )
-                    )
+                    dcc.Graph(figure=crear_box_progreso())
                 ], style={'width': '50%', 'display': 'inline-block'})
             ]),
             
+            # Distribución del progreso desde los resúmenes de cuantiles
+            html.Div([
+                dcc.Graph(figure=crear_histograma_progreso())
+            ], style={'margin': '20px 0'}),
+            
             # Análisis de presupuesto vs progreso
             html.Div([
                 dcc.Graph(
@@ -717,40 +1124,38 @@ def update_dashboard_content(vista, region, start_date, end_date):
         return html.Div([
             html.H2('🏆 Inteligencia Competitiva', style={'textAlign': 'center', 'color': '#2c3e50', 'marginBottom': '30px'}),
             
+            # Controles de período y número de competidores
+            html.Div([
+                html.Div([
+                    html.Label('📅 Trimestre:', style={'fontWeight': 'bold'}),
+                    dcc.Dropdown(
+                        id='benchmark-periodo',
+                        options=[{'label': f'{p:%Y}-Q{p.quarter}', 'value': p.strftime('%Y-%m-%d')}
+                                 for p in df_benchmark['Periodo'].drop_duplicates().sort_values(ascending=False)],
+                        value=df_benchmark['Periodo'].max().strftime('%Y-%m-%d'),
+                        clearable=False
+                    )
+                ], style={'width': '48%', 'display': 'inline-block'}),
+                html.Div([
+                    html.Label('🔝 Competidores mostrados (top-K por market share):', style={'fontWeight': 'bold'}),
+                    dcc.Slider(id='benchmark-top-k', min=TOP_K_MIN, max=TOP_K_MAX, step=1, value=10,
+                               marks={k: str(k) for k in (3, 5, 10, 15, 20)})
+                ], style={'width': '48%', 'display': 'inline-block', 'marginLeft': '4%'})
+            ], style={'margin': '20px 0'}),
+            
             # Análisis radar competitivo
             html.Div([
-                dcc.Graph(figure=crear_analisis_competitivo())
+                dcc.Graph(id='radar-competitivo', figure=crear_analisis_competitivo())
             ], style={'margin': '20px 0'}),
             
             # Métricas competitivas
             html.Div([
                 html.Div([
-                    dcc.Graph(
-                        figure=px.bar(
-                            df_benchmark.sort_values('Market_Share', ascending=True),
-                            x='Market_Share',
-                            y='Empresa',
-                            title='📊 Market Share por Competidor',
-                            orientation='h',
-                            color='Market_Share',
-                            color_continuous_scale='viridis'
-                        )
-                    )
+                    dcc.Graph(id='market-share-competidores', figure=crear_market_share_competidores())
                 ], style={'width': '50%', 'display': 'inline-block'}),
                 
                 html.Div([
-                    dcc.Graph(
-                        figure=px.scatter(
-                            df_benchmark,
-                            x='R&D_Investment_Billions',
-                            y='Innovation_Index',
-                            size='Patents_Filed',
-                            color='Customer_Satisfaction',
-                            hover_name='Empresa',
-                            title='🔬 I+D vs Innovación vs Patentes',
-                            labels={'R&D_Investment_Billions': 'Inversión I+D (B$)', 'Innovation_Index': 'Índice de Innovación'}
-                        )
-                    )
+                    dcc.Graph(id='scatter-id-competidores', figure=crear_scatter_id_competidores())
                 ], style={'width': '50%', 'display': 'inline-block'})
             ])
         ])
@@ -768,6 +1173,41 @@ def update_dashboard_content(vista, region, start_date, end_date):
             ])
         ])
 
+@app.callback(
+    [Output('radar-competitivo', 'figure'),
+     Output('market-share-competidores', 'figure'),
+     Output('scatter-id-competidores', 'figure')],
+    [Input('benchmark-periodo', 'value'),
+     Input('benchmark-top-k', 'value')],
+    prevent_initial_call=True
+)
+def update_benchmark(periodo, top_k):
+    periodo, top_k = normalizar_seleccion_benchmark(periodo, top_k)
+    return (crear_analisis_competitivo(periodo, top_k),
+            crear_market_share_competidores(periodo, top_k),
+            crear_scatter_id_competidores(periodo, top_k))
+
+@app.callback(
+    Output('heatmap-correlaciones', 'figure'),
+    [Input('tipo-correlacion', 'value')],
+    prevent_initial_call=True
+)
+def update_heatmap_correlaciones(tipo):
+    return crear_heatmap_correlaciones(tipo)
+
+@app.callback(
+    Output('scatter-par-kpis', 'figure'),
+    [Input('heatmap-correlaciones', 'clickData'),
+     Input('tipo-correlacion', 'value')],
+    prevent_initial_call=True
+)
+def update_scatter_par_kpis(click_data, tipo):
+    # Al cambiar de correlación se redibuja el último par pulsado (o el inicial)
+    columna_x, columna_y = click_data['points'][0]['customdata'] if click_data else PAR_KPIS_INICIAL
+    if columna_x not in COLUMNAS_KPIS or columna_y not in COLUMNAS_KPIS:
+        raise dash.exceptions.PreventUpdate
+    return crear_scatter_par_kpis(columna_x, columna_y, tipo)
+
 @app.callback(
     Output("download-dataframe-csv", "data"),
     [Input("export-btn", "n_clicks")],
@@ -836,5 +1276,8 @@ app.index_string = '''
 </html>
 '''
 
+# Servidor WSGI para gunicorn: gunicorn dashboard_bi_avanzado:server
+server = app.server
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=8050)
@@ -0,0 +1,283 @@
+# perfilado.py
+"""Perfilado bajo demanda de peticiones lentas con flame graphs.
+
+Un único hilo muestrea con `sys._current_frames()` las pilas de los hilos que
+atienden peticiones marcadas, sin instrumentar cada llamada, por lo que el
+coste es bajo y puede quedar activo en producción. Al terminar la petición,
+si se pidió explícitamente o superó el umbral de latencia, se escriben en el
+directorio de salida:
+
+- `<id>.folded`: pilas colapsadas (formato de flamegraph.pl / speedscope)
+- `<id>.svg`: flame graph autocontenido
+- `<id>.txt`: top-N de funciones por muestras propias y acumuladas
+
+Configuración por variables de entorno:
+
+- DASHBOARD_PERFILADO=1: muestrea todos los callbacks y guarda los lentos
+- DASHBOARD_PERFILADO_UMBRAL_MS: umbral de latencia (por defecto 1000)
+- DASHBOARD_PERFILADO_TOKEN: habilita la cabecera `X-Dashboard-Perfilar`
+  con ese valor para forzar el perfilado de una petición concreta
+- DASHBOARD_PERFILADO_DIR: directorio de salida (por defecto ./perfiles)
+- DASHBOARD_PERFILADO_INTERVALO_MS: periodo de muestreo (por defecto 5)
+- DASHBOARD_PERFILADO_TOP: funciones en el reporte (por defecto 25)
+- DASHBOARD_PERFILADO_MAX_POR_MINUTO: perfiles guardados por minuto y
+  proceso (por defecto 6); el resto se descarta
+- DASHBOARD_PERFILADO_MAX_PERFILES: perfiles conservados en el directorio
+  (por defecto 200); se borran los más antiguos
+
+Los ficheros se escriben en un hilo aparte con una cola acotada, así que la
+petición perfilada no espera al disco.
+"""
+import glob
+import hmac
+import html
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict
+from datetime import datetime
+
+CABECERA = 'X-Dashboard-Perfilar'
+RUTA_CALLBACKS = '/_dash-update-component'
+
+logger = logging.getLogger(__name__)
+
+
+class MuestreadorPilas:
+    """Hilo de muestreo compartido por todas las peticiones perfiladas"""
+
+    def __init__(self, intervalo=0.005):
+        self.intervalo = intervalo
+        self._activos = {}
+        self._lock = threading.Lock()
+        self._hay_trabajo = threading.Event()
+        self._hilo = None
+
+    def iniciar(self, hilo_id):
+        muestras = Counter()
+        with self._lock:
+            self._activos[hilo_id] = muestras
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name='muestreador-pilas', daemon=True)
+                self._hilo.start()
+        self._hay_trabajo.set()
+        return muestras
+
+    def detener(self, hilo_id):
+        with self._lock:
+            muestras = self._activos.pop(hilo_id, Counter())
+            if not self._activos:
+                self._hay_trabajo.clear()
+        return muestras
+
+    def _bucle(self):
+        while True:
+            self._hay_trabajo.wait()
+            frames = sys._current_frames()
+            with self._lock:
+                for hilo_id, muestras in self._activos.items():
+                    frame = frames.get(hilo_id)
+                    if frame is not None:
+                        muestras[_colapsar(frame)] += 1
+            del frames
+            time.sleep(self.intervalo)
+
+
+def _colapsar(frame):
+    """Pila de la raíz a la hoja en formato colapsado `f1;f2;f3`"""
+    pila = []
+    while frame is not None:
+        codigo = frame.f_code
+        pila.append(f'{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(pila))
+
+
+# Reportes
+def reporte_top(muestras, top=25):
+    """Funciones más costosas por muestras propias (hoja) y acumuladas"""
+    propias, acumuladas = Counter(), Counter()
+    for pila, n in muestras.items():
+        funciones = pila.split(';')
+        propias[funciones[-1]] += n
+        for funcion in set(funciones):
+            acumuladas[funcion] += n
+    total = sum(muestras.values()) or 1
+    lineas = [f"{'propio %':>9}{'acum. %':>9}{'muestras':>10}  función"]
+    for funcion, n in propias.most_common(top):
+        lineas.append(f'{n / total:>9.1%}{acumuladas[funcion] / total:>9.1%}{n:>10}  {funcion}')
+    lineas.append('')
+    lineas.append('Por tiempo acumulado:')
+    for funcion, n in acumuladas.most_common(top):
+        lineas.append(f'{n / total:>9.1%}{n:>10}  {funcion}')
+    return '\n'.join(lineas)
+
+
+def flame_graph_svg(muestras, titulo='', ancho=1200, alto_fila=16):
+    """Flame graph SVG autocontenido a partir de pilas colapsadas"""
+    arbol = lambda: defaultdict(arbol)
+    raiz, totales = arbol(), Counter()
+    for pila, n in muestras.items():
+        nodo, ruta = raiz, ()
+        for funcion in pila.split(';'):
+            ruta += (funcion,)
+            totales[ruta] += n
+            nodo = nodo[funcion]
+    total = sum(muestras.values()) or 1
+    profundidad = max((len(r) for r in totales), default=0)
+    alto = (profundidad + 3) * alto_fila
+    escala = ancho / total
+
+    rectangulos = []
+
+    def dibujar(nodo, ruta, x, nivel):
+        for funcion in sorted(nodo):
+            sub_ruta = ruta + (funcion,)
+            n = totales[sub_ruta]
+            w = n * escala
+            if w >= 0.5:
+                y = alto - (nivel + 2) * alto_fila
+                tono = zlib.crc32(funcion.encode()) % 55
+                etiqueta = html.escape(funcion)
+                texto = etiqueta if len(funcion) * 7 < w else ''
+                if not texto and w > 30:
+                    texto = html.escape(funcion[:int(w / 7) - 2]) + '..'
+                rectangulos.append(
+                    f'<g><title>{etiqueta} ({n} muestras, {n / total:.1%})</title>'
+                    f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{alto_fila - 1}" '
+                    f'fill="rgb(230,{90 + tono * 2},{30 + tono})" rx="2"/>'
+                    f'<text x="{x + 3:.1f}" y="{y + alto_fila - 4}">{texto}</text></g>')
+                dibujar(nodo[funcion], sub_ruta, x, nivel + 1)
+            x += w
+
+    dibujar(raiz, (), 0.0, 0)
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{ancho}" height="{alto}" '
+            f'font-family="monospace" font-size="11">'
+            f'<rect width="100%" height="100%" fill="#fafafa"/>'
+            f'<text x="{ancho / 2}" y="{alto_fila}" text-anchor="middle" font-size="14">{html.escape(titulo)}</text>'
+            + ''.join(rectangulos) + '</svg>')
+
+
+def guardar_perfil(directorio, muestras, nombre, duracion_ms, top=25):
+    """Escribe pilas colapsadas, flame graph y reporte top-N; devuelve la ruta base"""
+    os.makedirs(directorio, exist_ok=True)
+    marca = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    base = os.path.join(directorio, f"{marca}_{re.sub(r'[^A-Za-z0-9_.-]+', '_', nombre)[:80]}_{duracion_ms:.0f}ms")
+    with open(base + '.folded', 'w', encoding='utf-8') as f:
+        f.writelines(f'{pila} {n}\n' for pila, n in muestras.items())
+    with open(base + '.svg', 'w', encoding='utf-8') as f:
+        f.write(flame_graph_svg(muestras, f'{nombre} - {duracion_ms:.0f} ms'))
+    with open(base + '.txt', 'w', encoding='utf-8') as f:
+        f.write(f'{nombre}\nDuración: {duracion_ms:.1f} ms | Muestras: {sum(muestras.values())}\n\n')
+        f.write(reporte_top(muestras, top))
+    return base
+
+
+def aplicar_retencion(directorio, maximo):
+    """Borra los perfiles más antiguos por encima de `maximo`"""
+    reportes = sorted(glob.glob(os.path.join(directorio, '*.txt')))
+    for reporte in reportes[:max(0, len(reportes) - maximo)]:
+        base = reporte[:-len('.txt')]
+        for extension in ('.txt', '.svg', '.folded'):
+            try:
+                os.remove(base + extension)
+            except OSError:
+                pass
+
+
+class EscritorPerfiles:
+    """Guarda perfiles en segundo plano con límite de frecuencia y retención"""
+
+    def __init__(self, directorio, top=25, max_por_minuto=6, max_perfiles=200):
+        self.directorio = directorio
+        self.top = top
+        self.max_por_minuto = max_por_minuto
+        self.max_perfiles = max_perfiles
+        self.descartados = 0
+        self._recientes = []
+        self._lock = threading.Lock()
+        self._cola = queue.Queue(maxsize=max(1, max_por_minuto))
+        threading.Thread(target=self._bucle, name='escritor-perfiles', daemon=True).start()
+
+    def encolar(self, muestras, nombre, duracion_ms):
+        """Devuelve False si el perfil se descarta por límite de frecuencia o cola llena"""
+        ahora = time.monotonic()
+        with self._lock:
+            self._recientes = [t for t in self._recientes if ahora - t < 60]
+            if len(self._recientes) >= self.max_por_minuto:
+                self.descartados += 1
+                return False
+            try:
+                self._cola.put_nowait((muestras, nombre, duracion_ms))
+            except queue.Full:
+                self.descartados += 1
+                return False
+            self._recientes.append(ahora)
+        return True
+
+    def _bucle(self):
+        while True:
+            muestras, nombre, duracion_ms = self._cola.get()
+            # Cualquier error se registra y se sigue: si el hilo muriera, la cola se llenaría para siempre
+            try:
+                guardar_perfil(self.directorio, muestras, nombre, duracion_ms, self.top)
+                aplicar_retencion(self.directorio, self.max_perfiles)
+            except Exception:
+                logger.exception('No se pudo guardar el perfil de %r', nombre)
+
+
+# Integración con el servidor Flask de Dash
+def instalar_perfilado(server):
+    """Registra los hooks de perfilado si está habilitado por entorno; si no, no añade coste"""
+    import flask
+
+    global_activo = os.environ.get('DASHBOARD_PERFILADO', '0') == '1'
+    token = os.environ.get('DASHBOARD_PERFILADO_TOKEN')
+    if not global_activo and not token:
+        return None
+
+    umbral_ms = float(os.environ.get('DASHBOARD_PERFILADO_UMBRAL_MS', '1000'))
+    directorio = os.environ.get('DASHBOARD_PERFILADO_DIR', os.path.join(os.getcwd(), 'perfiles'))
+    escritor = EscritorPerfiles(
+        directorio,
+        top=int(os.environ.get('DASHBOARD_PERFILADO_TOP', '25')),
+        max_por_minuto=int(os.environ.get('DASHBOARD_PERFILADO_MAX_POR_MINUTO', '6')),
+        max_perfiles=int(os.environ.get('DASHBOARD_PERFILADO_MAX_PERFILES', '200'))
+    )
+    token_bytes = token.encode('utf-8') if token else b''
+    muestreador = MuestreadorPilas(float(os.environ.get('DASHBOARD_PERFILADO_INTERVALO_MS', '5')) / 1000)
+
+    @server.before_request
+    def _iniciar_perfil():
+        # compare_digest solo admite str ASCII: se comparan bytes para aceptar cualquier cabecera
+        cabecera = flask.request.headers.get(CABECERA, '').encode('utf-8', 'surrogateescape')
+        forzado = bool(token_bytes) and hmac.compare_digest(cabecera, token_bytes)
+        if not forzado and not (global_activo and flask.request.path == RUTA_CALLBACKS):
+            return
+        flask.g.perfil = {
+            'forzado': forzado,
+            'inicio': time.perf_counter(),
+            'hilo': threading.get_ident()
+        }
+        muestreador.iniciar(flask.g.perfil['hilo'])
+
+    @server.teardown_request
+    def _terminar_perfil(exc):
+        perfil = flask.g.pop('perfil', None)
+        if perfil is None:
+            return
+        muestras = muestreador.detener(perfil['hilo'])
+        duracion_ms = (time.perf_counter() - perfil['inicio']) * 1000
+        if perfil['forzado'] or (muestras and duracion_ms >= umbral_ms):
+            cuerpo = flask.request.get_json(silent=True)
+            nombre = cuerpo.get('output') if isinstance(cuerpo, dict) else None
+            if not isinstance(nombre, str) or not nombre:
+                nombre = flask.request.path
+            escritor.encolar(muestras, nombre, duracion_ms)
+
+    return muestreador
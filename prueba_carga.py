@@ -0,0 +1,390 @@
+# prueba_carga.py
+"""Generador de carga multiusuario para el dashboard BI.
+
+Simula sesiones realistas contra un servidor levantado en local: carga del
+layout, cambios de vista, región y rango de fechas, exportaciones y el
+polling de `dcc.Interval` con su propio temporizador (60 s, como la app). Reporta throughput, percentiles p50/p95/p99 por callback,
+tasa de errores y el RSS del servidor a lo largo del tiempo.
+
+Uso:
+    python prueba_carga.py --usuarios 50 --duracion 120 --pensar 2.0
+    python prueba_carga.py --workers 4 --usuarios 200 --salida carga.json
+
+Para dimensionar workers usar `--workers N`, que arranca `gunicorn -w N
+dashboard_bi_avanzado:server` y mide el RSS de todo el árbol de procesos.
+`--iniciar-servidor` sin `--workers` usa el servidor de desarrollo (debug y
+reloader) y solo sirve para pruebas funcionales rápidas.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import date, timedelta
+from urllib.parse import urlparse
+
+# Valores que toman los controles del layout
+VISTAS = ['executive', 'predictivo', 'proyectos', 'competitivo', 'completa']
+REGIONES = ['Todas', 'América', 'Europa', 'Asia-Pacífico', 'África']
+FECHA_MIN = date(2023, 1, 31)
+FECHA_MAX = date(2024, 12, 31)
+# Periodo del dcc.Interval 'interval-component' del layout (s)
+INTERVALO_POLLING = 60.0
+
+# Peso relativo de cada acción dentro de una sesión
+ACCIONES = {
+    'cambiar_vista': 30,
+    'cambiar_region': 25,
+    'cambiar_fechas': 15,
+    'exportar': 5
+}
+
+
+def parsear_argumentos(argv=None):
+    """Parámetros de la prueba de carga"""
+    parser = argparse.ArgumentParser(description='Prueba de carga del dashboard BI')
+    parser.add_argument('--url', default='http://127.0.0.1:8050', help='URL base del servidor')
+    parser.add_argument('--usuarios', type=int, default=20, help='Sesiones concurrentes')
+    parser.add_argument('--duracion', type=float, default=60.0, help='Duración de la prueba (s)')
+    parser.add_argument('--rampa', type=float, default=10.0, help='Tiempo para arrancar todas las sesiones (s)')
+    parser.add_argument('--pensar', type=float, default=3.0, help='Tiempo medio de reflexión entre acciones (s)')
+    parser.add_argument('--intervalo-polling', type=float, default=INTERVALO_POLLING,
+                        help='Periodo del polling de interval-component por sesión (s)')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Timeout por petición (s)')
+    parser.add_argument('--pid', type=int, default=None, help='PID del servidor para muestrear RSS')
+    parser.add_argument('--muestreo-rss', type=float, default=1.0, help='Intervalo de muestreo de RSS (s)')
+    parser.add_argument('--iniciar-servidor', action='store_true',
+                        help='Arranca el servidor de desarrollo de dashboard_bi_avanzado.py y mide su RSS')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Arranca gunicorn con N workers en el puerto de --url y mide su RSS')
+    parser.add_argument('--semilla', type=int, default=None, help='Semilla para reproducir las sesiones')
+    parser.add_argument('--salida', default=None, help='Fichero JSON con el reporte completo')
+    return parser.parse_args(argv)
+
+
+# Registro de métricas compartido entre hilos
+class Metricas:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.rss = []
+        self.inicio = time.time()
+
+    def registrar(self, nombre, segundos, ok):
+        with self.lock:
+            self.latencias[nombre].append(segundos)
+            if not ok:
+                self.errores[nombre] += 1
+
+    def registrar_rss(self, kb):
+        with self.lock:
+            self.rss.append((time.time() - self.inicio, kb))
+
+
+def percentil(valores_ordenados, p):
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not valores_ordenados:
+        return 0.0
+    k = max(0, min(len(valores_ordenados) - 1, math.ceil(p / 100 * len(valores_ordenados)) - 1))
+    return valores_ordenados[k]
+
+
+# Cliente HTTP de una sesión
+def peticion(metricas, nombre, url, timeout, payload=None):
+    """Ejecuta una petición GET/POST y registra su latencia"""
+    datos = None
+    cabeceras = {}
+    if payload is not None:
+        datos = json.dumps(payload).encode('utf-8')
+        cabeceras['Content-Type'] = 'application/json'
+    req = urllib.request.Request(url, data=datos, headers=cabeceras)
+    t0 = time.perf_counter()
+    ok = True
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            # 204 es la respuesta de Dash a PreventUpdate
+            ok = resp.status in (200, 204)
+    except urllib.error.HTTPError as e:
+        ok = e.code == 204
+    except Exception:
+        ok = False
+    metricas.registrar(nombre, time.perf_counter() - t0, ok)
+    return ok
+
+
+def payload_callback(output, inputs, cambiado):
+    """Cuerpo JSON que envía el renderer de Dash a /_dash-update-component"""
+    componente, propiedad = output.split('.')
+    return {
+        'output': output,
+        'outputs': {'id': componente, 'property': propiedad},
+        'inputs': [{'id': i, 'property': p, 'value': v} for (i, p), v in inputs],
+        'changedPropIds': [cambiado] if cambiado else [],
+        'state': []
+    }
+
+
+def rango_fechas_aleatorio(rng):
+    """Rango de fechas aleatorio dentro del histórico"""
+    total = (FECHA_MAX - FECHA_MIN).days
+    inicio = FECHA_MIN + timedelta(days=rng.randint(0, total - 30))
+    fin = inicio + timedelta(days=rng.randint(30, (FECHA_MAX - inicio).days))
+    return inicio.isoformat(), fin.isoformat()
+
+
+def ejecutar_sesion(args, metricas, rng, fin_prueba):
+    """Sesión de un usuario: carga inicial, acciones con tiempo de reflexión y polling periódico"""
+    base = args.url.rstrip('/')
+    callback_url = base + '/_dash-update-component'
+    estado = {
+        'vista': 'executive',
+        'region': 'Todas',
+        'fechas': (FECHA_MIN.isoformat(), FECHA_MAX.isoformat()),
+        'export_clicks': 0,
+        'n_intervals': 0
+    }
+
+    def contenido(cambiado):
+        inputs = [
+            (('dashboard-view', 'value'), estado['vista']),
+            (('region-filter', 'value'), estado['region']),
+            (('date-picker-range', 'start_date'), estado['fechas'][0]),
+            (('date-picker-range', 'end_date'), estado['fechas'][1])
+        ]
+        nombre = f"update_dashboard_content[{estado['vista']}]"
+        peticion(metricas, nombre, callback_url, args.timeout,
+                 payload_callback('main-dashboard-content.children', inputs, cambiado))
+
+    def polling(cambiado):
+        inputs = [(('interval-component', 'n_intervals'), estado['n_intervals'])]
+        peticion(metricas, 'update_clock', callback_url, args.timeout,
+                 payload_callback('live-clock.children', inputs, cambiado))
+        peticion(metricas, 'update_alertas', callback_url, args.timeout,
+                 payload_callback('alertas-panel.children', inputs, cambiado))
+
+    # Carga inicial de la página y callbacks de arranque
+    peticion(metricas, 'GET /', base + '/', args.timeout)
+    peticion(metricas, 'GET /_dash-layout', base + '/_dash-layout', args.timeout)
+    peticion(metricas, 'GET /_dash-dependencies', base + '/_dash-dependencies', args.timeout)
+    polling(None)
+    peticion(metricas, 'update_insights', callback_url, args.timeout,
+             payload_callback('insights-panel.children', [(('refresh-btn', 'n_clicks'), None)], None))
+    contenido(None)
+
+    def reflexion():
+        return rng.expovariate(1.0 / args.pensar) if args.pensar > 0 else 0
+
+    # El polling lleva su propio temporizador, independiente del tiempo de reflexión
+    nombres = list(ACCIONES)
+    pesos = list(ACCIONES.values())
+    proximo_polling = time.time() + args.intervalo_polling
+    proxima_accion = time.time() + reflexion()
+    while True:
+        espera = min(proximo_polling, proxima_accion, fin_prueba) - time.time()
+        if espera > 0:
+            time.sleep(espera)
+        ahora = time.time()
+        if ahora >= fin_prueba:
+            break
+        if ahora >= proximo_polling:
+            estado['n_intervals'] += 1
+            polling('interval-component.n_intervals')
+            proximo_polling += args.intervalo_polling
+            continue
+        accion = rng.choices(nombres, weights=pesos)[0]
+        if accion == 'cambiar_vista':
+            estado['vista'] = rng.choice(VISTAS)
+            contenido('dashboard-view.value')
+        elif accion == 'cambiar_region':
+            estado['region'] = rng.choice(REGIONES)
+            contenido('region-filter.value')
+        elif accion == 'cambiar_fechas':
+            estado['fechas'] = rango_fechas_aleatorio(rng)
+            contenido('date-picker-range.start_date')
+        elif accion == 'exportar':
+            estado['export_clicks'] += 1
+            inputs = [(('export-btn', 'n_clicks'), estado['export_clicks'])]
+            peticion(metricas, 'export_data', callback_url, args.timeout,
+                     payload_callback('download-dataframe-csv.data', inputs, 'export-btn.n_clicks'))
+        proxima_accion = time.time() + reflexion()
+
+
+# Muestreo de memoria del servidor (Linux, /proc)
+def procesos_del_arbol(pid):
+    """PID raíz más todos sus descendientes (workers de gunicorn, reloader)"""
+    pendientes, arbol = [pid], []
+    while pendientes:
+        actual = pendientes.pop()
+        arbol.append(actual)
+        try:
+            for tarea in os.listdir(f'/proc/{actual}/task'):
+                with open(f'/proc/{actual}/task/{tarea}/children') as f:
+                    pendientes.extend(int(h) for h in f.read().split())
+        except OSError:
+            continue
+    return arbol
+
+
+def rss_kb(pid):
+    """RSS total en KB del árbol de procesos del servidor"""
+    total = 0
+    for p in procesos_del_arbol(pid):
+        try:
+            with open(f'/proc/{p}/status') as f:
+                for linea in f:
+                    if linea.startswith('VmRSS:'):
+                        total += int(linea.split()[1])
+                        break
+        except OSError:
+            continue
+    return total
+
+
+def muestrear_rss(pid, metricas, intervalo, detener):
+    while not detener.is_set():
+        metricas.registrar_rss(rss_kb(pid))
+        detener.wait(intervalo)
+
+
+def esperar_servidor(url, timeout=60.0):
+    """Espera a que el servidor responda antes de lanzar la carga"""
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                return True
+        except Exception:
+            time.sleep(0.5)
+    return False
+
+
+def iniciar_servidor(args):
+    """Arranca gunicorn (--workers) o el servidor de desarrollo en su propio grupo de procesos"""
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    if args.workers:
+        destino = urlparse(args.url)
+        comando = [sys.executable, '-m', 'gunicorn', '-w', str(args.workers),
+                   '-b', f'{destino.hostname}:{destino.port or 80}', 'dashboard_bi_avanzado:server']
+    else:
+        comando = [sys.executable, os.path.join(directorio, 'dashboard_bi_avanzado.py')]
+    return subprocess.Popen(comando, cwd=directorio, start_new_session=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def detener_servidor(servidor):
+    """SIGTERM a todo el grupo (workers de gunicorn, proceso hijo del reloader)"""
+    try:
+        os.killpg(servidor.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    try:
+        servidor.wait(30)
+    except subprocess.TimeoutExpired:
+        os.killpg(servidor.pid, signal.SIGKILL)
+        servidor.wait()
+
+
+# Reporte
+def construir_reporte(metricas, duracion):
+    callbacks = {}
+    total_peticiones = total_errores = 0
+    for nombre, lat in sorted(metricas.latencias.items()):
+        ordenadas = sorted(lat)
+        errores = metricas.errores.get(nombre, 0)
+        total_peticiones += len(ordenadas)
+        total_errores += errores
+        callbacks[nombre] = {
+            'peticiones': len(ordenadas),
+            'throughput_rps': len(ordenadas) / duracion if duracion else 0.0,
+            'p50_ms': percentil(ordenadas, 50) * 1000,
+            'p95_ms': percentil(ordenadas, 95) * 1000,
+            'p99_ms': percentil(ordenadas, 99) * 1000,
+            'max_ms': ordenadas[-1] * 1000,
+            'tasa_error': errores / len(ordenadas)
+        }
+    return {
+        'duracion_s': duracion,
+        'peticiones': total_peticiones,
+        'throughput_rps': total_peticiones / duracion if duracion else 0.0,
+        'tasa_error': total_errores / total_peticiones if total_peticiones else 0.0,
+        'callbacks': callbacks,
+        'rss_kb': [{'t': round(t, 2), 'kb': kb} for t, kb in metricas.rss]
+    }
+
+
+def imprimir_reporte(reporte):
+    print(f"\n📊 Duración: {reporte['duracion_s']:.1f}s | Peticiones: {reporte['peticiones']} | "
+          f"Throughput: {reporte['throughput_rps']:.1f} req/s | Errores: {reporte['tasa_error']:.2%}")
+    print(f"{'Callback':<42}{'n':>7}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'error':>8}")
+    for nombre, c in reporte['callbacks'].items():
+        print(f"{nombre:<42}{c['peticiones']:>7}{c['throughput_rps']:>8.2f}{c['p50_ms']:>9.1f}"
+              f"{c['p95_ms']:>9.1f}{c['p99_ms']:>9.1f}{c['tasa_error']:>8.1%}")
+    if reporte['rss_kb']:
+        valores = [m['kb'] for m in reporte['rss_kb']]
+        print(f"\n🧠 RSS servidor: inicial {valores[0] / 1024:.1f}MB | "
+              f"pico {max(valores) / 1024:.1f}MB | final {valores[-1] / 1024:.1f}MB")
+
+
+def main(argv=None):
+    args = parsear_argumentos(argv)
+    rng_global = random.Random(args.semilla)
+    servidor = None
+    pid = args.pid
+
+    if args.iniciar_servidor or args.workers:
+        servidor = iniciar_servidor(args)
+        pid = servidor.pid
+    if not esperar_servidor(args.url.rstrip('/') + '/'):
+        print(f'❌ El servidor no responde en {args.url}')
+        if servidor:
+            detener_servidor(servidor)
+        return 1
+
+    metricas = Metricas()
+    detener = threading.Event()
+    muestreador = None
+    if pid and os.path.exists(f'/proc/{pid}'):
+        muestreador = threading.Thread(target=muestrear_rss, args=(pid, metricas, args.muestreo_rss, detener),
+                                       daemon=True)
+        muestreador.start()
+
+    inicio = time.time()
+    fin_prueba = inicio + args.duracion
+    hilos = []
+    for i in range(args.usuarios):
+        rng = random.Random(rng_global.random())
+        hilo = threading.Thread(target=ejecutar_sesion, args=(args, metricas, rng, fin_prueba), daemon=True)
+        hilos.append(hilo)
+        hilo.start()
+        if args.usuarios > 1:
+            time.sleep(args.rampa / args.usuarios)
+
+    for hilo in hilos:
+        hilo.join(max(0.0, fin_prueba - time.time()) + args.timeout)
+    detener.set()
+    if muestreador:
+        muestreador.join()
+    if servidor:
+        detener_servidor(servidor)
+
+    reporte = construir_reporte(metricas, time.time() - inicio)
+    imprimir_reporte(reporte)
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as f:
+            json.dump(reporte, f, indent=2, ensure_ascii=False)
+        print(f'💾 Reporte guardado en {args.salida}')
+    return 1 if reporte['tasa_error'] > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())